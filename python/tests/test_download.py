@@ -0,0 +1,242 @@
+"""Tests for stream downloads (parallel ranges, resume, 416, pipe merges) against a local http.server
+
+Run from the repository root with: python -m unittest discover -s python/tests
+"""
+
+import contextlib
+import io
+import os
+import re
+import shutil
+import sys
+import tempfile
+import textwrap
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from yt_downloader import YouTubeDownloader, _ConnectionPool  # noqa: E402
+
+MEDIA = bytes(range(256)) * 1200
+_RANGE = re.compile(r'bytes=(\d+)-(\d*)')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body=b'', headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        byte_range = self.headers.get('Range')
+        with self.server.lock:
+            self.server.requests.append((self.path, byte_range))
+
+        # /short/<path> cuts the connection halfway through a full (non-range) reply
+        path = self.path
+        short = path.startswith('/short/')
+        if short:
+            path = path[len('/short'):]
+
+        match = _RANGE.fullmatch(byte_range or '')
+        if path == '/norange' or not match:
+            if short:
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(MEDIA)))
+                self.end_headers()
+                self.wfile.write(MEDIA[:len(MEDIA) // 2])
+                self.close_connection = True
+            else:
+                self._reply(200, MEDIA)
+            return
+
+        start = int(match.group(1))
+        end = min(int(match.group(2) or len(MEDIA) - 1), len(MEDIA) - 1)
+        if start >= len(MEDIA):
+            self._reply(416, headers=[('Content-Range', f'bytes */{len(MEDIA)}')])
+        elif path == '/shifted':
+            # Claims a range, but always sends the stream from the start
+            self._reply(206, MEDIA, [('Content-Range', f'bytes 0-{len(MEDIA) - 1}/{len(MEDIA)}')])
+        else:
+            self._reply(206, MEDIA[start:end + 1], [('Content-Range', f'bytes {start}-{end}/{len(MEDIA)}')])
+
+
+# Stand-in for FFmpeg that logs its inputs and writes them, one after the other, to the output
+_FAKE_FFMPEG = textwrap.dedent('''\
+    import os, sys
+    args = sys.argv[1:]
+    inputs = [args[i + 1] for i, arg in enumerate(args) if arg == '-i']
+    with open(os.environ['FAKE_FFMPEG_LOG'], 'w') as log:
+        log.write(' '.join(inputs))
+    with open(args[-1], 'wb') as out:
+        for name in inputs:
+            source = os.fdopen(int(name[5:]), 'rb') if name.startswith('pipe:') else open(name, 'rb')
+            with source:
+                out.write(source.read())
+''')
+
+
+class _ServerTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        cls.server.daemon_threads = True
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.requests = []
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.filepath = os.path.join(self.tmpdir, 'video.mp4')
+
+        self.downloader = YouTubeDownloader()
+        self.downloader._http = _ConnectionPool(proxies={})
+        self.addCleanup(self.close_idle)
+        self.downloader._sleep_backoff = lambda *args, **kwargs: None
+        self.downloader.PARALLEL_MIN_SIZE = 64 * 1024
+
+    def close_idle(self):
+        for idle in self.downloader._http._idle.values():
+            for conn, _ in idle:
+                conn.close()
+
+
+class DownloadStreamTest(_ServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.part_path = self.filepath + '.18.part'
+
+    def download(self, path='/media'):
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.downloader._download_stream(self.base + path, self.filepath, itag=18)
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), MEDIA)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['video.mp4'])
+
+    def write_part(self, data):
+        with open(self.part_path, 'wb') as f:
+            f.write(data)
+
+    def test_parallel_download(self):
+        self.download()
+        ranges = sorted(byte_range for _, byte_range in self.server.requests)
+        # One probe, then a range per connection
+        self.assertEqual(len(ranges), 1 + self.downloader.DOWNLOAD_CONNECTIONS)
+        self.assertIn('bytes=0-0', ranges)
+
+    def test_resumes_part_file(self):
+        self.write_part(MEDIA[:100000])
+        self.download()
+        self.assertEqual(self.server.requests, [('/media', 'bytes=100000-')])
+
+    def test_complete_part_file_answered_with_416(self):
+        self.write_part(MEDIA)
+        self.download()
+        self.assertEqual(self.server.requests, [('/media', f'bytes={len(MEDIA)}-')])
+
+    def test_oversized_part_file_restarts(self):
+        self.write_part(MEDIA + b'extra')
+        self.download()
+        self.assertEqual(self.server.requests, [('/media', f'bytes={len(MEDIA) + 5}-'), ('/media', None)])
+
+    def test_server_ignoring_range(self):
+        self.download('/norange')
+        # The probe gets the full body, so a single connection downloads it
+        self.assertEqual(self.server.requests, [('/norange', 'bytes=0-0'), ('/norange', None)])
+
+        self.server.requests = []
+        os.unlink(self.filepath)
+        self.write_part(MEDIA[:100000])
+        self.download('/norange')
+        self.assertEqual(self.server.requests, [('/norange', 'bytes=100000-')])
+
+    def test_mismatched_content_range_restarts(self):
+        self.write_part(MEDIA[:100000])
+        self.download('/shifted')
+        self.assertEqual(self.server.requests, [('/shifted', 'bytes=100000-'), ('/shifted', None)])
+
+
+class PipeMergeTest(_ServerTestCase):
+
+    def pipe(self, path):
+        read_fd, write_fd = os.pipe()
+        received = []
+
+        def read_all():
+            with open(read_fd, 'rb') as pipe_file:
+                received.append(pipe_file.read())
+
+        reader = threading.Thread(target=read_all)
+        reader.start()
+        try:
+            with open(write_fd, 'wb', buffering=0) as pipe_file, contextlib.redirect_stderr(io.StringIO()):
+                self.downloader._pipe_stream(self.base + path, pipe_file)
+        finally:
+            reader.join()
+        return received[0]
+
+    def test_resumes_interrupted_stream(self):
+        self.assertEqual(self.pipe('/short/media'), MEDIA)
+        self.assertEqual(self.server.requests, [('/short/media', None), ('/short/media', f'bytes={len(MEDIA) // 2}-')])
+
+    def test_mismatched_content_range_fails(self):
+        with self.assertRaises(OSError):
+            self.pipe('/short/shifted')
+        self.assertEqual(self.server.requests[1], ('/short/shifted', f'bytes={len(MEDIA) // 2}-'))
+
+    def test_server_ignoring_range_fails(self):
+        with self.assertRaises(OSError):
+            self.pipe('/short/norange')
+
+    @unittest.skipUnless(os.name == 'posix', 'pipe merges need inherited descriptors')
+    def test_download_video_pipe_merge(self):
+        bin_dir = os.path.join(self.tmpdir, 'bin')
+        os.mkdir(bin_dir)
+        ffmpeg = os.path.join(bin_dir, 'ffmpeg')
+        with open(ffmpeg, 'w') as f:
+            f.write(f'#!{sys.executable}\n{_FAKE_FFMPEG}')
+        os.chmod(ffmpeg, 0o755)
+        log_path = os.path.join(self.tmpdir, 'ffmpeg.log')
+
+        info = {'id': 'dQw4w9WgXcQ', 'title': 'Video', 'formats': [
+            {'itag': 137, 'quality': '1080p', 'mimeType': 'video/mp4', 'url': self.base + '/media',
+             'hasAudio': False, 'hasVideo': True, 'bitrate': 4000},
+            {'itag': 140, 'quality': 'tiny', 'mimeType': 'audio/mp4; codecs="mp4a.40.2"', 'url': self.base + '/media',
+             'hasAudio': True, 'hasVideo': False, 'bitrate': 128},
+        ]}
+        output = os.path.join(self.tmpdir, 'out')
+        env = {'PATH': bin_dir + os.pathsep + os.environ.get('PATH', ''), 'FAKE_FFMPEG_LOG': log_path}
+        with mock.patch.dict(os.environ, env), mock.patch.object(self.downloader, 'get_video_info', return_value=info):
+            with contextlib.redirect_stderr(io.StringIO()):
+                result = self.downloader.download_video('dQw4w9WgXcQ', output, pipe_merge=True)
+
+        self.assertTrue(result.get('success'), result)
+        with open(result['filepath'], 'rb') as f:
+            self.assertEqual(f.read(), MEDIA + MEDIA)
+        with open(log_path) as f:
+            self.assertTrue(all(name.startswith('pipe:') for name in f.read().split()))
+        self.assertEqual(os.listdir(output), [result['filename']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,17 +8,517 @@ import json
 import sys
 import os
 import re
-import urllib.request
 import urllib.parse
 import urllib.error
+import urllib.request
 import time
 import random
-import gzip
+import socket
+import select
+import io
+import base64
 import subprocess
 import tempfile
+import threading
+import contextlib
+import functools
+import http.client
+from collections import OrderedDict
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor, CancelledError, as_completed
+
+# orjson is optional; it parses the large player responses several times faster
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# ijson's C backend parses the player response straight off the socket and builds
+# only the parts we use, so the raw body is never held in memory. It is used when
+# orjson isn't installed; its pure-Python backends are far slower, so only yajl2_c
+# is taken
+try:
+    import ijson.backends.yajl2_c as ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
+
+
+# isal's SIMD inflate decodes the gzipped API responses 2-3x faster than zlib
+try:
+    from isal import isal_zlib as _zlib
+except ImportError:
+    import zlib as _zlib
+
+
+def _read_body(response, chunk_size=64 * 1024):
+    """Read a response body, inflating gzip as it arrives instead of after the last byte"""
+    if response.headers.get('Content-Encoding') != 'gzip':
+        return response.read()
+
+    # wbits=31 selects the gzip container
+    decompressor = _zlib.decompressobj(31)
+    parts = []
+    while True:
+        chunk = response.read(chunk_size)
+        if not chunk:
+            break
+        parts.append(decompressor.decompress(chunk))
+    parts.append(decompressor.flush())
+    return b''.join(parts)
+
+
+class _InflatingReader:
+    """File-like view of a gzip response body, inflated as it is read"""
+
+    def __init__(self, response, chunk_size=64 * 1024):
+        self.response = response
+        self.chunk_size = chunk_size
+        # wbits=31 selects the gzip container
+        self._decompressor = _zlib.decompressobj(31)
+        self._eof = False
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return b''.join(iter(functools.partial(self.read, self.chunk_size), b''))
+        if size == 0:
+            # max_length=0 would mean no limit; ijson probes the type with read(0)
+            return b''
+
+        while True:
+            # Input held back by an earlier max_length is inflated before reading more
+            data = self._decompressor.unconsumed_tail
+            if not data:
+                if self._eof:
+                    return b''
+                data = self.response.read(self.chunk_size)
+                if not data:
+                    self._eof = True
+                    return self._decompressor.flush()
+            inflated = self._decompressor.decompress(data, size)
+            if inflated:
+                return inflated
+
+
+def _body_reader(response):
+    """File-like reader over a response body that inflates gzip on the fly"""
+    if response.headers.get('Content-Encoding') != 'gzip':
+        return response
+    return _InflatingReader(response)
+
+
+if orjson is not None:
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+else:
+    _loads = json.loads
+
+    def _dumps(obj):
+        # Same compact UTF-8 output as orjson, so request bodies don't depend on what's installed
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+# Patterns compiled once at import instead of on every call
+# An ID after 'v=' or any '/' (which covers /embed/, /shorts/ and youtu.be/), or a bare ID
+_VIDEO_ID_IN_URL = re.compile(r'(?:v=|/)([0-9A-Za-z_-]{11})|^([0-9A-Za-z_-]{11})$')
+# Top-level keys of the player response that get_video_info reads
+_PLAYER_RESPONSE_KEYS = frozenset(('playabilityStatus', 'videoDetails', 'streamingData'))
+
+_VIDEO_ID = re.compile(r'[0-9A-Za-z_-]{11}')
+_RESOLUTION = re.compile(r'(\d+)p')
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+_UNSATISFIED_RANGE = re.compile(r'bytes \*/(\d+)')
+_UNSAFE_CHARS = re.compile(r'[^\w\s-]')
+_DASH_SPACE = re.compile(r'[-\s]+')
+
+
+def _resolution(quality):
+    """Vertical resolution from a quality label like '720p' or '1080p60' (0 if unknown)"""
+    match = _RESOLUTION.match(quality) if isinstance(quality, str) else None
+    return int(match.group(1)) if match else 0
+
+
+def _muxed_format(fmt, stream_url):
+    """Format entry for a muxed stream, which always carries both audio and video"""
+    return {
+        'itag': fmt.get('itag'),
+        'quality': fmt.get('qualityLabel') or fmt.get('quality'),
+        'mimeType': fmt.get('mimeType'),
+        'url': stream_url,
+        'hasAudio': True,
+        'hasVideo': True
+    }
+
+
+def _adaptive_format(fmt, stream_url):
+    """Format entry for an adaptive stream, audio-only or video-only as told by the mime type"""
+    mime_type = fmt.get('mimeType', '')
+    return {
+        'itag': fmt.get('itag'),
+        'quality': fmt.get('qualityLabel') or fmt.get('quality'),
+        'mimeType': mime_type,
+        'url': stream_url,
+        'hasAudio': 'audio' in mime_type,
+        'hasVideo': 'video' in mime_type,
+        'bitrate': fmt.get('bitrate')
+    }
+
+
+def _parse_player_stream(reader):
+    """Parse a player response as it's read, materializing only the top-level keys we read"""
+    result = {}
+    key = builder = None
+    
+    for prefix, event, value in ijson.parse(reader, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == key and event in ('end_map', 'end_array'):
+                result[key] = builder.value
+                key = builder = None
+        elif prefix in _PLAYER_RESPONSE_KEYS:
+            if event in ('start_map', 'start_array'):
+                key, builder = prefix, ObjectBuilder()
+                builder.event(event, value)
+            else:
+                result[prefix] = value
+    
+    return result
+
+
+def _fadvise(file_obj, advice, offset=0, length=0):
+    """Hint the kernel about how a file will be accessed (no-op where unsupported)"""
+    advice = getattr(os, advice, None)
+    if advice is None or not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(file_obj.fileno(), offset, length, advice)
+    except OSError:
+        pass
+
+
+def _drop_cached(path):
+    """Hint that a finished file's pages won't be read again
+    
+    Only a hint: on Linux, clean pages are dropped and writeback of dirty ones is
+    started, but those stay cached until they're written and reclaimed as usual.
+    """
+    try:
+        with open(path, 'rb', buffering=0) as file_obj:
+            _fadvise(file_obj, 'POSIX_FADV_DONTNEED')
+    except OSError:
+        pass
+
+
+def _connection_dropped(conn):
+    """True if an idle connection can't be reused: closed by the server or holding stray data"""
+    sock = conn.sock
+    if sock is None:
+        return True
+    try:
+        # An idle keep-alive socket only turns readable when the server sent EOF (or junk)
+        if hasattr(select, 'poll'):
+            poller = select.poll()
+            poller.register(sock, select.POLLIN)
+            return bool(poller.poll(0))
+        return bool(select.select([sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+# Cached because the same stream URL is requested once per range and per retry
+@functools.lru_cache(maxsize=64)
+def _split_url(url):
+    """Split a URL into its pool key (scheme, host) and request path"""
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    return (parts.scheme, parts.netloc), path
+
+
+class _ConnectionPool:
+    """Keep-alive HTTP(S) connections shared across requests to the same host
+
+    Like urlopen, requests go through the http_proxy/https_proxy proxies from the
+    environment (unless no_proxy exempts the host): HTTPS through a CONNECT tunnel,
+    plain HTTP as absolute-form requests to the proxy.
+    """
+
+    REDIRECT_CODES = (301, 302, 303, 307, 308)
+    # Seconds a resolved address list is reused, and how many hosts are remembered
+    DNS_TTL = 300
+    DNS_CACHE_SIZE = 256
+    # Seconds an idle connection is kept; servers close theirs soon after, often silently
+    IDLE_TIMEOUT = 4
+
+    def __init__(self, maxsize=8, max_redirects=5, proxies=None):
+        self.maxsize = maxsize
+        self.max_redirects = max_redirects
+        # scheme -> proxy URL, as returned by urllib.request.getproxies()
+        self.proxies = urllib.request.getproxies() if proxies is None else proxies
+        # (scheme, host) -> [(connection, idle since)], newest last
+        self._idle = {}
+        self._lock = threading.Lock()
+        # (host, port) -> (expiry, addresses), oldest first
+        self._dns = OrderedDict()
+        # (scheme, host) -> proxy route, see _route
+        self._routes = {}
+
+    def _route(self, key):
+        """(proxy host:port, proxy headers) for a (scheme, host) key, or None to go direct"""
+        with self._lock:
+            if key in self._routes:
+                return self._routes[key]
+
+        scheme, host = key
+        proxy = self.proxies.get(scheme)
+        route = None
+        if proxy and not urllib.request.proxy_bypass(host):
+            parts = urllib.parse.urlsplit(proxy if '://' in proxy else 'http://' + proxy)
+            proxy_headers = {}
+            if parts.username is not None:
+                credentials = f'{urllib.parse.unquote(parts.username)}:{urllib.parse.unquote(parts.password or "")}'
+                proxy_headers['Proxy-Authorization'] = 'Basic ' + base64.b64encode(credentials.encode()).decode('ascii')
+            route = (parts.netloc.rpartition('@')[2], proxy_headers)
+
+        with self._lock:
+            # Bounded like the DNS cache; routes are cheap to work out again
+            if len(self._routes) >= self.DNS_CACHE_SIZE:
+                self._routes.clear()
+            self._routes[key] = route
+        return route
+
+    def _resolve(self, host, port):
+        """Socket addresses for host:port, looked up at most once per DNS_TTL"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._dns.get((host, port))
+        if cached and cached[0] > now:
+            return cached[1]
+
+        addresses = [info[4][:2] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+        with self._lock:
+            self._dns[(host, port)] = (now + self.DNS_TTL, addresses)
+            self._dns.move_to_end((host, port))
+            while len(self._dns) > self.DNS_CACHE_SIZE:
+                self._dns.popitem(last=False)
+        return addresses
+
+    def _create_connection(self, address, *args):
+        """socket.create_connection that resolves the host through the DNS cache"""
+        host, port = address
+        error = None
+        for resolved in self._resolve(host, port):
+            try:
+                return socket.create_connection(resolved, *args)
+            except OSError as e:
+                error = e
+
+        # Every cached address failed - look the host up again next time
+        with self._lock:
+            self._dns.pop((host, port), None)
+        raise error
+
+    def _acquire(self, key, timeout, fresh=False):
+        """Return (connection, reused) for the given (scheme, host) key
+
+        Idle connections that timed out or were closed by the server are discarded;
+        fresh skips the idle ones altogether.
+        """
+        while not fresh:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    break
+                conn, idle_since = idle.pop()
+
+            if time.monotonic() - idle_since < self.IDLE_TIMEOUT and not _connection_dropped(conn):
+                conn.timeout = timeout
+                conn.sock.settimeout(timeout)
+                return conn, True
+            conn.close()
+
+        scheme, host = key
+        conn_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        route = self._route(key)
+        if route is None:
+            conn = conn_class(host, timeout=timeout)
+        else:
+            proxy, proxy_headers = route
+            conn = conn_class(proxy, timeout=timeout)
+            if scheme == 'https':
+                # TLS runs end to end through a CONNECT tunnel and verifies the real host
+                conn.set_tunnel(host, headers=proxy_headers)
+        # Only name resolution changes; TLS still verifies against the host name
+        conn._create_connection = self._create_connection
+        return conn, False
+
+    def _release(self, key, conn, response):
+        """Return the connection to the pool if the response was fully consumed"""
+        if response is None or not response.isclosed() or response.will_close:
+            conn.close()
+            return
+
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxsize:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def _send(self, key, method, path, body, headers, timeout):
+        """Send a request, retrying once on a new socket if a reused one went stale"""
+        route = self._route(key)
+        if route is not None and key[0] == 'http':
+            # A plain HTTP proxy takes the full URL as the request target
+            path = f'http://{key[1]}{path}'
+            headers = {**headers, **route[1]}
+
+        conn, reused = self._acquire(key, timeout)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if not reused:
+                raise
+
+        # Other idle sockets to this host are likely just as stale - don't try them too
+        conn, _ = self._acquire(key, timeout, fresh=True)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+    @contextlib.contextmanager
+    def open(self, method, url, body=None, headers=None, timeout=30):
+        """Open a pooled response, following redirects and raising HTTPError like urlopen"""
+        headers = headers or {}
+
+        for _ in range(self.max_redirects + 1):
+            key, path = _split_url(url)
+            conn, response = self._send(key, method, path, body, headers, timeout)
+
+            location = response.headers.get('Location')
+            if response.status in self.REDIRECT_CODES and location:
+                response.read()
+                self._release(key, conn, response)
+                url = urllib.parse.urljoin(url, location)
+                if response.status == 303:
+                    method, body = 'GET', None
+                continue
+
+            if response.status >= 400:
+                error_body = response.read()
+                self._release(key, conn, response)
+                raise urllib.error.HTTPError(url, response.status, response.reason,
+                                             response.headers, io.BytesIO(error_body))
+
+            try:
+                yield response
+            finally:
+                self._release(key, conn, response)
+            return
+
+        raise urllib.error.URLError(f'Too many redirects for {url}')
+
+
+# Process-wide pool; sized for concurrent context probes plus parallel range downloads
+_SHARED_POOL = _ConnectionPool(maxsize=16)
+
+
+class _Progress:
+    """Thread-safe byte counter that redraws a throttled progress line on stderr"""
+
+    def __init__(self, total_size, interval, downloaded=0, label=''):
+        self.total_size = total_size
+        self.interval = interval
+        self.downloaded = downloaded
+        self.label = label
+        self._next_report = time.monotonic()
+        self._lock = threading.Lock()
+
+    def update(self, count):
+        with self._lock:
+            self.downloaded += count
+
+            if self.total_size > 0:
+                now = time.monotonic()
+                if now >= self._next_report or self.downloaded >= self.total_size:
+                    progress = (self.downloaded / self.total_size) * 100
+                    mb_downloaded = self.downloaded / (1024 * 1024)
+                    mb_total = self.total_size / (1024 * 1024)
+                    sys.stderr.write(f"\r  {self.label}Progress: {progress:.1f}% ({mb_downloaded:.1f}/{mb_total:.1f} MB)")
+                    sys.stderr.flush()
+                    self._next_report = now + self.interval
+
+
+def _read_log(log_file):
+    """Return everything written to a subprocess log file as text"""
+    log_file.seek(0)
+    return log_file.read().decode('utf-8', 'replace')
+
+
+def _copy_response(response, out_file, chunk_size):
+    """Copy a response body to out_file through one reusable buffer
+
+    Reading into the same buffer saves allocating a new bytes object per chunk.
+    Zero-copy sendfile isn't an option: its source can't be a socket, let alone TLS.
+    """
+    buffer = memoryview(bytearray(chunk_size))
+    while True:
+        count = response.readinto(buffer)
+        if not count:
+            break
+        out_file.write(buffer[:count])
+
+
+class _ProgressWriter:
+    """File wrapper that counts written bytes towards a _Progress
+
+    Once the optional stop event is set, the next write raises CancelledError.
+    """
+
+    def __init__(self, out_file, progress, stop=None):
+        self.out_file = out_file
+        self.progress = progress
+        self.stop = stop
+
+    def write(self, data):
+        if self.stop is not None and self.stop.is_set():
+            raise CancelledError()
+        # Unbuffered (raw) files may accept only part of a chunk per call
+        view = memoryview(data)
+        while view:
+            written = self.out_file.write(view)
+            self.progress.update(written)
+            view = view[written:]
 
 
 class YouTubeDownloader:
+    # Minimum seconds between progress line redraws
+    PROGRESS_INTERVAL = 0.05
+    # Read size used when copying a stream to disk; files are opened unbuffered,
+    # so each chunk goes straight to os.write without a second in-process copy
+    CHUNK_SIZE = 1024 * 1024
+    # How long (seconds) and how many get_video_info results are kept in memory
+    INFO_CACHE_TTL = 600
+    INFO_CACHE_SIZE = 1024
+    # Seconds a less preferred client that answered is asked alone before the others again
+    LAST_GOOD_CONTEXT_TTL = 300
+    # HTTP statuses worth retrying (bot checks, rate limiting and transient server errors)
+    RETRY_STATUS_CODES = (403, 429, 500, 502, 503, 504)
+    # Parallel Range connections per stream (1 disables splitting) and the smallest stream worth splitting
+    DOWNLOAD_CONNECTIONS = 4
+    PARALLEL_MIN_SIZE = 4 * 1024 * 1024
+    # Feed merges straight into FFmpeg through pipes (POSIX only) instead of temp files.
+    # Halves the disk traffic, but gives up parallel ranges and .part resume for merges.
+    # Default for download_video's pipe_merge (--pipe-merge on the command line)
+    PIPE_MERGE = False
+    
     def __init__(self):
         # Rotate between multiple realistic user agents (updated to latest versions)
         self.user_agents = [
@@ -71,168 +571,347 @@ class YouTubeDownloader:
                 }
             }
         ]
-    
-    def _get_headers(self, for_api=False):
-        """Get randomized headers to avoid bot detection"""
-        headers = {
+        
+        # Player request bodies differ only in the video ID, so each context is serialized
+        # once. Keyed by id() with the context kept alongside, so a replaced dict can't match
+        self._payload_templates = {
+            id(context): (context, b'","context":' + _dumps(context) + b'}')
+            for context in [self.innertube_context] + self.fallback_contexts
+        }
+        
+        # Keep-alive connections reused across the player API calls, retries and stream
+        # downloads - shared by every instance, so a new downloader starts with warm sockets
+        self._http = _SHARED_POOL
+        
+        # video_id -> (timestamp, info), oldest first; locked since serve mode runs
+        # several requests at once
+        self._info_cache = OrderedDict()
+        self._info_cache_lock = threading.Lock()
+        
+        # Output directories already created by this instance
+        self._created_dirs = set()
+        
+        # Absolute output path -> [lock, holders] while downloads of it run; see _lock_target
+        self._target_locks = {}
+        self._target_locks_guard = threading.Lock()
+        
+        # (context, expiry) of the context that last returned downloadable formats;
+        # asked alone before fanning out
+        self._last_good_context = None
+        
+        # Pick one user agent per session - a browser doesn't change it between requests
+        base_headers = {
             'User-Agent': random.choice(self.user_agents),
             'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate',
+            # Only gzip is decoded in _make_request, so don't advertise deflate
+            'Accept-Encoding': 'gzip',
             'Connection': 'keep-alive',
         }
+        # Both header sets are built once; callers that need changes work on a copy
+        self._api_headers = {
+            **base_headers,
+            'Accept': 'application/json',
+            'Origin': 'https://www.youtube.com',
+            'Referer': 'https://www.youtube.com/',
+            'X-Youtube-Client-Name': '1',
+            'X-Youtube-Client-Version': '2.20240201.00.00',
+        }
+        # API POSTs (every player request) also need the JSON content type
+        self._api_json_headers = {**self._api_headers, 'Content-Type': 'application/json'}
+        self._browser_headers = {
+            **base_headers,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Upgrade-Insecure-Requests': '1',
+            'Sec-Fetch-Dest': 'document',
+            'Sec-Fetch-Mode': 'navigate',
+            'Sec-Fetch-Site': 'none',
+            'Cache-Control': 'max-age=0',
+        }
+    
+    def clear_cache(self):
+        """Drop all cached video info"""
+        with self._info_cache_lock:
+            self._info_cache.clear()
+    
+    def _get_headers(self, for_api=False):
+        """Get browser-like headers (with this session's user agent) to avoid bot detection"""
+        return (self._api_headers if for_api else self._browser_headers).copy()
+    
+    def _make_request(self, url, data=None, headers=None, max_retries=3, is_api=False, parse=None):
+        """Make HTTP request with retry logic, returning the response body as bytes
         
-        if for_api:
-            headers.update({
-                'Accept': 'application/json',
-                'Origin': 'https://www.youtube.com',
-                'Referer': 'https://www.youtube.com/',
-                'X-Youtube-Client-Name': '1',
-                'X-Youtube-Client-Version': '2.20240201.00.00',
-            })
-        else:
-            headers.update({
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Upgrade-Insecure-Requests': '1',
-                'Sec-Fetch-Dest': 'document',
-                'Sec-Fetch-Mode': 'navigate',
-                'Sec-Fetch-Site': 'none',
-                'Cache-Control': 'max-age=0',
-            })
+        With parse, the body is instead handed to parse(reader) as a file-like
+        object while it downloads, and its result is returned.
+        """
+        # Encode the JSON body once, not on every retry (bytes are taken as already encoded)
+        body = None
+        if data:
+            body = data if isinstance(data, bytes) else _dumps(data)
         
-        return headers
-    
-    def _make_request(self, url, data=None, headers=None, max_retries=3, is_api=False):
-        """Make HTTP request with retry logic"""
         if headers is None:
-            headers = self._get_headers(for_api=is_api)
+            # Never modified below, so the prebuilt dicts are used without copying
+            if is_api:
+                headers = self._api_json_headers if body else self._api_headers
+            else:
+                headers = self._browser_headers
+        if body and headers.get('Content-Type') != 'application/json':
+            headers = {**headers, 'Content-Type': 'application/json'}
+        method = 'POST' if body else 'GET'
         
         for attempt in range(max_retries):
             try:
-                # Add small random delay between retries to appear more human-like
-                if attempt > 0:
-                    delay = random.uniform(1.0, 3.0)
-                    sys.stderr.write(f"Waiting {delay:.1f}s before retry...\n")
-                    time.sleep(delay)
-                
-                if data:
-                    data = json.dumps(data).encode('utf-8')
-                    headers['Content-Type'] = 'application/json'
-                
-                req = urllib.request.Request(url, data=data, headers=headers)
-                with urllib.request.urlopen(req, timeout=30) as response:
-                    content = response.read()
-                    
-                    # Handle gzip encoding
-                    if response.headers.get('Content-Encoding') == 'gzip':
-                        content = gzip.decompress(content)
-                    
-                    # Decode bytes to string
-                    if isinstance(content, bytes):
-                        content = content.decode('utf-8')
-                    
-                    return content
+                with self._http.open(method, url, body=body, headers=headers, timeout=30) as response:
+                    if parse is not None:
+                        return parse(_body_reader(response))
+                    return _read_body(response)
             except urllib.error.HTTPError as e:
-                if e.code == 403 and attempt < max_retries - 1:
-                    # Wait before retry with exponential backoff
-                    wait_time = (2 ** attempt) + random.uniform(0, 1)
-                    sys.stderr.write(f"\nReceived 403, retrying in {wait_time:.1f}s...\n")
-                    time.sleep(wait_time)
+                if e.code in self.RETRY_STATUS_CODES and attempt < max_retries - 1:
+                    sys.stderr.write(f"\nReceived {e.code}. ")
+                    self._sleep_backoff(attempt, retry_after=e.headers.get('Retry-After'))
                     continue
                 raise
             except Exception as e:
                 if attempt < max_retries - 1:
-                    time.sleep(1)
+                    self._sleep_backoff(attempt)
                     continue
                 raise
     
+    def _sleep_backoff(self, attempt, base=1.0, cap=30.0, retry_after=None):
+        """Sleep with capped, jittered exponential backoff, honoring a Retry-After hint"""
+        delay = min(cap, base * 2 ** attempt) * (1 + random.uniform(-0.5, 0.5))
+        
+        if retry_after:
+            try:
+                delay = max(delay, min(cap, float(retry_after)))
+            except ValueError:
+                # HTTP-date form of Retry-After; fall back to our own backoff
+                pass
+        
+        sys.stderr.write(f"Waiting {delay:.1f}s before retry...\n")
+        time.sleep(delay)
+    
     def extract_video_id(self, url):
         """Extract video ID from YouTube URL"""
-        patterns = [
-            r'(?:v=|\/)([0-9A-Za-z_-]{11}).*',
-            r'(?:embed\/)([0-9A-Za-z_-]{11})',
-            r'^([0-9A-Za-z_-]{11})$'
-        ]
+        # Fast path for the common watch?v=<id> form
+        query = urllib.parse.urlsplit(url).query
+        if query:
+            video_id = urllib.parse.parse_qs(query).get('v', [None])[0]
+            if video_id and _VIDEO_ID.fullmatch(video_id):
+                return video_id
         
-        for pattern in patterns:
-            match = re.search(pattern, url)
-            if match:
-                return match.group(1)
+        match = _VIDEO_ID_IN_URL.search(url)
+        if match:
+            return match.group(1) or match.group(2)
         
         raise ValueError("Could not extract video ID from URL")
     
-    def get_video_info(self, url):
-        """Extract video information using innertube API"""
+    def _fetch_player_response(self, api_url, video_id, context):
+        """Fetch the innertube player response for a single client context"""
+        template = self._payload_templates.get(id(context))
+        if template is not None and template[0] is context:
+            # extract_video_id only returns [0-9A-Za-z_-] IDs, which need no JSON escaping
+            payload = b'{"videoId":"' + video_id.encode('ascii') + template[1]
+        else:
+            payload = {
+                "videoId": video_id,
+                "context": context
+            }
+        if ijson is not None and orjson is None:
+            # Parse while the body arrives, so the raw response is never held whole
+            return self._make_request(api_url, data=payload, is_api=True, parse=_parse_player_stream)
+        return _loads(self._make_request(api_url, data=payload, is_api=True))
+    
+    @staticmethod
+    def _first_playable(results):
+        """Return the playable response of the most preferred context, once decidable
+        
+        A context's OK response only wins once every context ahead of it has failed,
+        so a quick WEB answer (whose streams need signature deciphering) can't beat
+        the clients we prefer. Returns None while that is still undecided.
+        """
+        for result in results:
+            if result is None:
+                # A more preferred context is still in flight
+                return None
+            if YouTubeDownloader._is_playable(result):
+                return result
+        return None
+    
+    @staticmethod
+    def _is_playable(result):
+        """Whether a context probe result is a player response with an OK status"""
+        return not isinstance(result, Exception) and result.get('playabilityStatus', {}).get('status') == 'OK'
+    
+    @staticmethod
+    def _has_direct_urls(result):
+        """Whether a player response has formats with a plain URL (not a signatureCipher)"""
+        streaming_data = result.get('streamingData', {})
+        return any('url' in fmt for key in ('formats', 'adaptiveFormats')
+                   for fmt in streaming_data.get(key, ()))
+    
+    @staticmethod
+    def _select_video(video_formats, quality):
+        """Pick the video for quality from (resolution, format) pairs, as download_video does
+        
+        'best' and 'worst' take the highest and lowest resolution, 'NNNp' the exact
+        one or else the closest; max/min keep the first of equal candidates.
+        Returns (target resolution or None, resolution, format), with format None
+        when there is nothing to pick. Raises ValueError for an invalid quality.
+        """
+        if quality == 'best':
+            return (None,) + max(video_formats, key=itemgetter(0), default=(0, None))
+        if quality == 'worst':
+            return (None,) + min(video_formats, key=itemgetter(0), default=(0, None))
+        if quality.endswith('p'):
+            try:
+                target_res = int(quality.replace('p', ''))
+            except ValueError:
+                raise ValueError(f'Invalid quality format: {quality}. Use format like "720p" or "best"') from None
+            # An exact match is at distance 0, so it always beats the other resolutions
+            return (target_res,) + min(video_formats, key=lambda res_f: abs(res_f[0] - target_res),
+                                       default=(0, None))
+        raise ValueError(f'Invalid quality: {quality}. Use "best", "worst", or a resolution like "720p"')
+    
+    @staticmethod
+    def _target_formats(streaming_data, quality):
+        """Format entries download_video could pick for quality, or None to build them all
+        
+        Of the video streams only the one _select_video picks gets a format dict;
+        every audio-only stream does, for download_video to choose from. Invalid
+        quality values return None and are left for download_video to reject.
+        """
+        # (resolution, (entry builder, raw entry, url)) for every stream with video,
+        # in the same order as the full format list
+        video_entries = []
+        formats = []
+        for fmt in streaming_data.get('formats', ()):
+            if stream_url := fmt.get('url'):
+                video_entries.append((_resolution(fmt.get('qualityLabel') or fmt.get('quality')),
+                                      (_muxed_format, fmt, stream_url)))
+        for fmt in streaming_data.get('adaptiveFormats', ()):
+            if stream_url := fmt.get('url'):
+                mime_type = fmt.get('mimeType', '')
+                if 'video' in mime_type:
+                    video_entries.append((_resolution(fmt.get('qualityLabel') or fmt.get('quality')),
+                                          (_adaptive_format, fmt, stream_url)))
+                elif 'audio' in mime_type:
+                    formats.append(_adaptive_format(fmt, stream_url))
+        
+        try:
+            selected = YouTubeDownloader._select_video(video_entries, quality)[2]
+        except ValueError:
+            return None
+        if selected is None:
+            return None
+        
+        build, fmt, stream_url = selected
+        formats.insert(0, build(fmt, stream_url))
+        return formats
+    
+    def get_video_info(self, url, target_quality=None):
+        """Extract video information using innertube API
+        
+        With target_quality (as taken by download_video) a fresh lookup only builds
+        the formats that download could use (see _target_formats); such a result
+        isn't cached. A cached
+        full result is returned as is.
+        """
         try:
             video_id = self.extract_video_id(url)
             
+            with self._info_cache_lock:
+                cached = self._info_cache.get(video_id)
+                if cached:
+                    cached_at, info = cached
+                    if time.time() - cached_at < self.INFO_CACHE_TTL:
+                        self._info_cache.move_to_end(video_id)
+                        return info
+                    del self._info_cache[video_id]
+            
             # Use innertube API - more reliable than HTML scraping
             api_url = "https://www.youtube.com/youtubei/v1/player"
             
             # Try primary context first
             contexts_to_try = [self.innertube_context] + self.fallback_contexts
             
-            for idx, context in enumerate(contexts_to_try):
-                # Add delay between context attempts to avoid rate limiting
-                if idx > 0:
-                    time.sleep(random.uniform(0.5, 1.5))
-                payload = {
-                    "videoId": video_id,
-                    "context": context
-                }
-                
+            results = [None] * len(contexts_to_try)
+            player_response = None
+            
+            # The context that worked last time usually works again, so in batch use
+            # one round trip is typically enough. It expires, so a transient failure
+            # of the preferred clients doesn't pin a lesser one for good
+            remembered = self._last_good_context
+            if remembered is not None and remembered[1] > time.monotonic():
+                context = remembered[0]
+                idx = contexts_to_try.index(context)
                 try:
-                    response_text = self._make_request(api_url, data=payload, is_api=True)
-                    player_response = json.loads(response_text)
+                    results[idx] = self._fetch_player_response(api_url, video_id, context)
+                except Exception as e:
+                    results[idx] = e
+                # Anything but the top client only wins alone with formats we can download
+                if self._is_playable(results[idx]) and (idx == 0 or self._has_direct_urls(results[idx])):
+                    player_response = results[idx]
+                else:
+                    self._last_good_context = None
+            
+            if player_response is None:
+                # Probe the remaining contexts concurrently and keep the most preferred playable response
+                executor = ThreadPoolExecutor(max_workers=len(contexts_to_try))
+                futures = {}
+                try:
+                    for idx, context in enumerate(contexts_to_try):
+                        if results[idx] is None:
+                            futures[executor.submit(self._fetch_player_response, api_url, video_id, context)] = idx
                     
-                    if 'playabilityStatus' in player_response:
-                        status = player_response['playabilityStatus'].get('status')
-                        if status == 'OK':
-                            # Success! Process and return
+                    for future in as_completed(futures):
+                        idx = futures[future]
+                        try:
+                            results[idx] = future.result()
+                        except Exception as e:
+                            results[idx] = e
+                        
+                        player_response = self._first_playable(results)
+                        if player_response is not None:
                             break
-                        elif status == 'UNPLAYABLE':
-                            # Try next context
-                            continue
-                        else:
-                            reason = player_response['playabilityStatus'].get('reason', 'Unknown error')
-                            # Don't return error yet, try next context
-                            if context == contexts_to_try[-1]:  # Last context
-                                return {'error': f'Video not available: {reason}'}
-                            continue
-                except Exception as e:
-                    if context == contexts_to_try[-1]:  # Last context
-                        raise
-                    continue
+                finally:
+                    # Don't wait for the slower contexts once we have an answer
+                    for future in futures:
+                        future.cancel()
+                    executor.shutdown(wait=False)
+                
+                if player_response is not None:
+                    winner = next(context for context, result in zip(contexts_to_try, results)
+                                  if result is player_response)
+                    self._last_good_context = ((winner, time.monotonic() + self.LAST_GOOD_CONTEXT_TTL)
+                                               if self._has_direct_urls(player_response) else None)
+            
+            if player_response is None:
+                # Nothing playable - report the last context's outcome like the serial loop did
+                last_result = results[-1]
+                if isinstance(last_result, Exception):
+                    raise last_result
+                
+                status = last_result.get('playabilityStatus', {})
+                if status and status.get('status') != 'UNPLAYABLE':
+                    reason = status.get('reason', 'Unknown error')
+                    return {'error': f'Video not available: {reason}'}
+                player_response = last_result
             
             video_details = player_response.get('videoDetails', {})
             streaming_data = player_response.get('streamingData', {})
             
-            formats = []
-            
-            # Process formats
-            for fmt in streaming_data.get('formats', []):
-                if fmt.get('url'):
-                    formats.append({
-                        'itag': fmt.get('itag'),
-                        'quality': fmt.get('qualityLabel', fmt.get('quality')),
-                        'mimeType': fmt.get('mimeType'),
-                        'url': fmt.get('url'),
-                        'hasAudio': True,
-                        'hasVideo': True
-                    })
-            
-            # Process adaptive formats
-            for fmt in streaming_data.get('adaptiveFormats', []):
-                if fmt.get('url'):
-                    mime_type = fmt.get('mimeType', '')
-                    formats.append({
-                        'itag': fmt.get('itag'),
-                        'quality': fmt.get('qualityLabel', fmt.get('quality')),
-                        'mimeType': mime_type,
-                        'url': fmt.get('url'),
-                        'hasAudio': 'audio' in mime_type,
-                        'hasVideo': 'video' in mime_type,
-                        'bitrate': fmt.get('bitrate')
-                    })
+            formats = self._target_formats(streaming_data, target_quality) if target_quality else None
+            # A pruned list must not be served to a later caller that wants every format
+            cacheable = formats is None
+            
+            if formats is None:
+                formats = []
+                for fmt in streaming_data.get('formats', ()):
+                    if stream_url := fmt.get('url'):
+                        formats.append(_muxed_format(fmt, stream_url))
+                for fmt in streaming_data.get('adaptiveFormats', ()):
+                    if stream_url := fmt.get('url'):
+                        formats.append(_adaptive_format(fmt, stream_url))
             
             info = {
                 'id': video_id,
@@ -245,43 +924,399 @@ class YouTubeDownloader:
                 'thumbnail': video_details.get('thumbnail', {}).get('thumbnails', [{}])[-1].get('url', '')
             }
             
+            if cacheable:
+                with self._info_cache_lock:
+                    self._info_cache[video_id] = (time.time(), info)
+                    self._info_cache.move_to_end(video_id)
+                    while len(self._info_cache) > self.INFO_CACHE_SIZE:
+                        self._info_cache.popitem(last=False)
+            
             return info
             
         except Exception as e:
             return {'error': str(e)}
     
-    def _download_stream(self, url, filepath, description=""):
-        """Helper method to download a single stream"""
-        headers = self._get_headers()
-        req = urllib.request.Request(url, headers=headers)
+    def _download_stream(self, url, filepath, description="", max_retries=3, label='', keep_cached=False, itag=None):
+        """Helper method to download a single stream
+        
+        Data goes to '<filepath>.<itag>.part' and is renamed once complete, so a
+        failed or interrupted transfer resumes from the partial file with a Range
+        request. The itag keeps a partial file of another format of the same video
+        from being taken as a prefix of this one. Parallel downloads fill their file
+        out of order, so they use '<filepath>.<itag>.parallel' instead, which is
+        never resumed.
+        label prefixes the progress line when several streams download at once.
+        keep_cached leaves the written pages in the page cache for a file that is
+        about to be read back (merge inputs); otherwise the kernel is told they
+        won't be needed (a hint, see _drop_cached).
+        """
+        base_path = f'{filepath}.{itag}' if itag is not None else filepath
+        part_path = base_path + '.part'
         
         if description:
             sys.stderr.write(f"{description}\n")
         
-        with urllib.request.urlopen(req, timeout=60) as response:
-            total_size = int(response.headers.get('Content-Length', 0))
-            downloaded = 0
-            chunk_size = 8192
+        # Fresh downloads of large streams are split across several connections
+        if self.DOWNLOAD_CONNECTIONS > 1 and not os.path.exists(part_path):
+            parallel_path = base_path + '.parallel'
+            try:
+                if self._download_parallel(url, parallel_path, label, keep_cached):
+                    os.replace(parallel_path, filepath)
+                    sys.stderr.write("\n")
+                    return
+            except Exception as e:
+                sys.stderr.write(f"\nParallel download failed ({e!r}), falling back to a single connection\n")
+            finally:
+                # Its size says nothing about which ranges arrived, so it's never kept
+                if os.path.exists(parallel_path):
+                    os.unlink(parallel_path)
+        
+        for attempt in range(max_retries):
+            start = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = self._stream_headers(f'{start}-' if start else None)
             
-            with open(filepath, 'wb') as out_file:
-                while True:
-                    chunk = response.read(chunk_size)
-                    if not chunk:
-                        break
+            try:
+                with self._http.open('GET', url, headers=headers, timeout=60) as response:
+                    if response.status != 206:
+                        # Range not honored - rewrite the file from the beginning
+                        start = 0
+                    elif start:
+                        # Only append if the server continues exactly where the partial file ends
+                        content_range = _CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+                        if (not content_range or int(content_range.group(1)) != start
+                                or (content_range.group(3).isdigit()
+                                    and int(content_range.group(3)) != int(content_range.group(2)) + 1)):
+                            os.unlink(part_path)
+                            raise urllib.error.URLError(f'Range response does not continue the partial file at byte {start}')
+                    
+                    content_length = int(response.headers.get('Content-Length', 0))
+                    total_size = start + content_length if content_length else 0
                     
-                    out_file.write(chunk)
-                    downloaded += len(chunk)
+                    progress = _Progress(total_size, self.PROGRESS_INTERVAL, downloaded=start, label=label)
+                    with open(part_path, 'ab' if start else 'wb', buffering=0) as out_file:
+                        _fadvise(out_file, 'POSIX_FADV_SEQUENTIAL')
+                        _copy_response(response, _ProgressWriter(out_file, progress), self.CHUNK_SIZE)
+                        # Written once and not read back by us. Only a hint: clean pages go now,
+                        # dirty ones are queued for writeback and stay cached until reclaimed
+                        if not keep_cached:
+                            _fadvise(out_file, 'POSIX_FADV_DONTNEED')
                     
-                    if total_size > 0:
-                        progress = (downloaded / total_size) * 100
-                        mb_downloaded = downloaded / (1024 * 1024)
-                        mb_total = total_size / (1024 * 1024)
-                        sys.stderr.write(f"\r  Progress: {progress:.1f}% ({mb_downloaded:.1f}/{mb_total:.1f} MB)")
-                        sys.stderr.flush()
+                    if total_size and progress.downloaded < total_size:
+                        raise http.client.IncompleteRead(b'', total_size - progress.downloaded)
+                break
+            except urllib.error.HTTPError as e:
+                if e.code == 416 and start:
+                    unsatisfied = _UNSATISFIED_RANGE.match(e.headers.get('Content-Range', ''))
+                    if unsatisfied and int(unsatisfied.group(1)) == start:
+                        # The partial file already holds the whole stream
+                        break
+                    # It's longer than the stream or of unknown length - start over
+                    os.unlink(part_path)
+                    if attempt < max_retries - 1:
+                        continue
+                if e.code in self.RETRY_STATUS_CODES and attempt < max_retries - 1:
+                    sys.stderr.write(f"\nReceived {e.code}. ")
+                    self._sleep_backoff(attempt, retry_after=e.headers.get('Retry-After'))
+                    continue
+                raise
+            except (http.client.HTTPException, OSError) as e:
+                if attempt < max_retries - 1:
+                    sys.stderr.write(f"\nDownload interrupted ({e!r}). ")
+                    self._sleep_backoff(attempt)
+                    continue
+                raise
         
+        os.replace(part_path, filepath)
         sys.stderr.write("\n")
     
-    def download_video(self, url, output_path='.', quality='best', audio_only=False, merge=True):
+    def _stream_headers(self, byte_range=None):
+        """Headers for a media request, optionally limited to a 'start-end' byte range"""
+        headers = self._get_headers()
+        # Media is written to disk as-is, so it must not come back compressed
+        headers['Accept-Encoding'] = 'identity'
+        if byte_range:
+            headers['Range'] = f'bytes={byte_range}'
+        return headers
+    
+    def _probe_size(self, url):
+        """Return the stream size if the server honors Range requests, else None"""
+        with self._http.open('GET', url, headers=self._stream_headers('0-0'), timeout=30) as response:
+            if response.status != 206:
+                # Full body on its way - leave it unread so the connection is dropped
+                return None
+            response.read()
+        
+        content_range = _CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+        if not content_range or not content_range.group(3).isdigit():
+            return None
+        return int(content_range.group(3))
+    
+    def _download_parallel(self, url, temp_path, label='', keep_cached=False):
+        """Download a stream as DOWNLOAD_CONNECTIONS concurrent byte ranges into temp_path
+        
+        Returns False without downloading when the server doesn't support ranges
+        or the stream is too small to be worth splitting. The first range that
+        fails stops the others and its error is raised.
+        """
+        total_size = self._probe_size(url)
+        if not total_size or total_size < self.PARALLEL_MIN_SIZE:
+            return False
+        
+        span = -(-total_size // self.DOWNLOAD_CONNECTIONS)
+        ranges = [(start, min(start + span, total_size) - 1) for start in range(0, total_size, span)]
+        progress = _Progress(total_size, self.PROGRESS_INTERVAL, label=label)
+        
+        # Preallocate so every range can be written in place at its own offset. Real
+        # allocation (where supported) keeps the file contiguous; otherwise it's sparse
+        with open(temp_path, 'wb') as out_file:
+            try:
+                os.posix_fallocate(out_file.fileno(), 0, total_size)
+            except (AttributeError, OSError):
+                out_file.truncate(total_size)
+        
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [executor.submit(self._download_range, url, temp_path, start, end, progress,
+                                       keep_cached=keep_cached, stop=stop)
+                       for start, end in ranges]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except BaseException:
+                # The download is lost either way - don't wait for the other ranges to finish
+                stop.set()
+                for future in futures:
+                    future.cancel()
+                raise
+        
+        return True
+    
+    def _download_range(self, url, temp_path, start, end, progress, max_retries=3, keep_cached=False, stop=None):
+        """Download bytes start..end (inclusive) into the same offsets of temp_path
+        
+        Raises CancelledError as soon as the optional stop event is set.
+        """
+        with open(temp_path, 'r+b', buffering=0) as out_file:
+            _fadvise(out_file, 'POSIX_FADV_SEQUENTIAL', start, end + 1 - start)
+            out_file.seek(start)
+            
+            for attempt in range(max_retries):
+                if stop is not None and stop.is_set():
+                    raise CancelledError()
+                # Continue from wherever the previous attempt stopped
+                position = out_file.tell()
+                
+                try:
+                    with self._http.open('GET', url, headers=self._stream_headers(f'{position}-{end}'), timeout=60) as response:
+                        content_range = _CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+                        if response.status != 206 or not content_range or int(content_range.group(1)) != position:
+                            raise urllib.error.URLError(f'Range request for bytes {position}-{end} was not honored')
+                        _copy_response(response, _ProgressWriter(out_file, progress, stop), self.CHUNK_SIZE)
+                    
+                    if out_file.tell() <= end:
+                        raise http.client.IncompleteRead(b'', end + 1 - out_file.tell())
+                    
+                    # Same hint for this range as for a single-connection download
+                    if not keep_cached:
+                        _fadvise(out_file, 'POSIX_FADV_DONTNEED', start, end + 1 - start)
+                    return
+                except urllib.error.HTTPError as e:
+                    if e.code in self.RETRY_STATUS_CODES and attempt < max_retries - 1 and not (stop is not None and stop.is_set()):
+                        self._sleep_backoff(attempt, retry_after=e.headers.get('Retry-After'))
+                        continue
+                    raise
+                except (http.client.HTTPException, OSError):
+                    if attempt < max_retries - 1 and not (stop is not None and stop.is_set()):
+                        self._sleep_backoff(attempt)
+                        continue
+                    raise
+    
+    def _merge_command(self, video_input, audio_input, filepath, audio_mime_type=''):
+        """FFmpeg command line that muxes the video and audio inputs into filepath"""
+        # AAC goes into the MP4 as-is; anything else (Opus from WebM) has to be re-encoded
+        audio_codec = 'copy' if 'mp4a' in audio_mime_type else 'aac'
+        return [
+            # Errors only and no progress line - the log is kept only to report a failure
+            'ffmpeg', '-y', '-nostdin', '-loglevel', 'error', '-nostats',
+            '-i', video_input,
+            '-i', audio_input,
+            '-c:v', 'copy',
+            '-c:a', audio_codec,
+            # Put the index up front so the file can start playing before it's fully read
+            '-movflags', '+faststart',
+            filepath
+        ]
+    
+    def _merge_via_files(self, video_url, audio_url, filepath, audio_mime_type=''):
+        """Download both streams to temp files, then merge them with FFmpeg
+        
+        Returns FFmpeg's error output, or None on success.
+        """
+        # Create temporary files
+        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as video_temp:
+            video_temp_path = video_temp.name
+        
+        with tempfile.NamedTemporaryFile(suffix='.m4a', delete=False) as audio_temp:
+            audio_temp_path = audio_temp.name
+        
+        try:
+            # Download the video and audio streams at the same time. FFmpeg reads them
+            # straight back, so their pages stay cached; unlinking frees them afterwards
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                downloads = [
+                    executor.submit(self._download_stream, video_url, video_temp_path,
+                                    "Downloading video stream...", label='[V] ', keep_cached=True),
+                    executor.submit(self._download_stream, audio_url, audio_temp_path,
+                                    "Downloading audio stream...", label='[A] ', keep_cached=True),
+                ]
+                for download in downloads:
+                    download.result()
+            
+            # Merge with FFmpeg
+            sys.stderr.write("\nMerging video and audio with FFmpeg...\n")
+            
+            # FFmpeg's log goes to a file rather than being buffered in memory through a pipe
+            with tempfile.TemporaryFile() as ffmpeg_log:
+                result = subprocess.run(self._merge_command(video_temp_path, audio_temp_path, filepath, audio_mime_type),
+                                        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=ffmpeg_log)
+                
+                if result.returncode != 0:
+                    return _read_log(ffmpeg_log)
+            
+            # The merged file isn't read again here either
+            _drop_cached(filepath)
+            return None
+        
+        finally:
+            # Clean up temp files (and any partial downloads left behind)
+            for temp_path in (video_temp_path, audio_temp_path,
+                              video_temp_path + '.part', audio_temp_path + '.part'):
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+    
+    def _merge_via_pipes(self, video_url, audio_url, filepath, audio_mime_type=''):
+        """Stream both downloads straight into FFmpeg through inherited pipes
+        
+        Returns FFmpeg's error output, or None on success.
+        """
+        def feed(url, fd, label):
+            # Closing the write end is what tells FFmpeg the input is complete
+            with open(fd, 'wb', buffering=0) as pipe_file:
+                self._pipe_stream(url, pipe_file, label=label)
+        
+        # A log file never fills up, so FFmpeg can't block on it while the streams are fed
+        with tempfile.TemporaryFile() as ffmpeg_log:
+            video_read, video_write = os.pipe()
+            audio_read, audio_write = os.pipe()
+            
+            try:
+                # FFmpeg reads each input from its own inherited descriptor
+                process = subprocess.Popen(
+                    self._merge_command(f'pipe:{video_read}', f'pipe:{audio_read}', filepath, audio_mime_type),
+                    pass_fds=(video_read, audio_read),
+                    stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=ffmpeg_log,
+                )
+            except BaseException:
+                for fd in (video_write, audio_write):
+                    os.close(fd)
+                raise
+            finally:
+                os.close(video_read)
+                os.close(audio_read)
+            
+            sys.stderr.write("Downloading and merging video and audio with FFmpeg...\n")
+            
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                feeds = [
+                    executor.submit(feed, video_url, video_write, '[V] '),
+                    executor.submit(feed, audio_url, audio_write, '[A] '),
+                ]
+            process.wait()
+            sys.stderr.write("\n")
+            
+            for future in feeds:
+                error = future.exception()
+                # A broken pipe only means FFmpeg stopped reading; its exit status says why
+                if error is not None and not isinstance(error, BrokenPipeError):
+                    # FFmpeg may have finished a file from the truncated input
+                    if os.path.exists(filepath):
+                        os.unlink(filepath)
+                    raise error
+            
+            if process.returncode != 0:
+                return _read_log(ffmpeg_log)
+        
+        _drop_cached(filepath)
+        return None
+    
+    def _pipe_stream(self, url, pipe_file, max_retries=3, label=''):
+        """Write a stream into a pipe, resuming with a Range request after an interruption"""
+        written = 0
+        
+        for attempt in range(max_retries):
+            headers = self._stream_headers(f'{written}-' if written else None)
+            
+            try:
+                with self._http.open('GET', url, headers=headers, timeout=60) as response:
+                    if written:
+                        # Bytes already in the pipe can't be taken back, so the reply must
+                        # continue exactly where they end and run to the end of the stream
+                        content_range = _CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+                        if (response.status != 206 or not content_range or int(content_range.group(1)) != written
+                                or (content_range.group(3).isdigit()
+                                    and int(content_range.group(3)) != int(content_range.group(2)) + 1)):
+                            raise urllib.error.URLError(f'Server did not resume the stream at byte {written}; '
+                                                        'it cannot be resumed')
+                    
+                    content_length = int(response.headers.get('Content-Length', 0))
+                    total_size = written + content_length if content_length else 0
+                    
+                    progress = _Progress(total_size, self.PROGRESS_INTERVAL, downloaded=written, label=label)
+                    try:
+                        _copy_response(response, _ProgressWriter(pipe_file, progress), self.CHUNK_SIZE)
+                    finally:
+                        written = progress.downloaded
+                    
+                    if total_size and written < total_size:
+                        raise http.client.IncompleteRead(b'', total_size - written)
+                return
+            except BrokenPipeError:
+                # FFmpeg is gone - retrying can't help
+                raise
+            except urllib.error.HTTPError as e:
+                if e.code in self.RETRY_STATUS_CODES and attempt < max_retries - 1:
+                    sys.stderr.write(f"\nReceived {e.code}. ")
+                    self._sleep_backoff(attempt, retry_after=e.headers.get('Retry-After'))
+                    continue
+                raise
+            except (http.client.HTTPException, OSError) as e:
+                if attempt < max_retries - 1:
+                    sys.stderr.write(f"\nDownload interrupted ({e!r}). ")
+                    self._sleep_backoff(attempt)
+                    continue
+                raise
+    
+    @contextlib.contextmanager
+    def _lock_target(self, filepath):
+        """Let only one download at a time write filepath
+        
+        Serve mode runs requests concurrently, and two downloads of the same file
+        would truncate each other's partial and temporary files.
+        """
+        key = os.path.abspath(filepath)
+        with self._target_locks_guard:
+            entry = self._target_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._target_locks_guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._target_locks[key]
+    
+    def download_video(self, url, output_path='.', quality='best', audio_only=False, merge=True, pipe_merge=None):
         """Download video from YouTube
         
         Args:
@@ -290,9 +1325,12 @@ class YouTubeDownloader:
             quality: Resolution (e.g., '720p', '1080p', '480p', 'best', 'worst')
             audio_only: Download audio only
             merge: Merge separate video and audio streams (requires ffmpeg)
+            pipe_merge: Stream a merge straight into FFmpeg instead of via temp files
+                (POSIX only; defaults to PIPE_MERGE)
         """
         try:
-            info = self.get_video_info(url)
+            # Audio-only downloads pick from the audio formats alone, so only prune for video
+            info = self.get_video_info(url, target_quality=None if audio_only else quality)
             
             if 'error' in info:
                 return info
@@ -302,12 +1340,14 @@ class YouTubeDownloader:
             if not formats:
                 return {'error': 'No formats available with direct URLs'}
             
-            # Ensure output directory exists
-            os.makedirs(output_path, exist_ok=True)
+            # Ensure output directory exists (once per instance)
+            if output_path not in self._created_dirs:
+                os.makedirs(output_path, exist_ok=True)
+                self._created_dirs.add(output_path)
             
             # Generate safe filename
-            safe_title = re.sub(r'[^\w\s-]', '', info['title'])
-            safe_title = re.sub(r'[-\s]+', '_', safe_title)[:100]  # Limit length
+            safe_title = _UNSAFE_CHARS.sub('', info['title'])
+            safe_title = _DASH_SPACE.sub('_', safe_title)[:100]  # Limit length
             
             # Handle audio-only download
             if audio_only:
@@ -315,8 +1355,7 @@ class YouTubeDownloader:
                 if not audio_formats:
                     return {'error': 'No audio-only formats found'}
                 
-                audio_formats.sort(key=lambda x: x.get('bitrate', 0), reverse=True)
-                selected_format = audio_formats[0]
+                selected_format = max(audio_formats, key=lambda x: x.get('bitrate', 0))
                 
                 extension = 'mp3'
                 filename = f"{safe_title}_{info['id']}.{extension}"
@@ -325,7 +1364,9 @@ class YouTubeDownloader:
                 sys.stderr.write(f"Downloading: {info['title']}\n")
                 sys.stderr.write(f"Audio bitrate: {selected_format.get('bitrate', 'unknown')}\n\n")
                 
-                self._download_stream(selected_format['url'], filepath, "Downloading audio...")
+                with self._lock_target(filepath):
+                    self._download_stream(selected_format['url'], filepath, "Downloading audio...",
+                                          itag=selected_format['itag'])
                 
                 sys.stderr.write("✓ Download completed!\n")
                 
@@ -336,44 +1377,23 @@ class YouTubeDownloader:
                     'title': info['title']
                 }
             
-            # Helper function to extract resolution number
-            def get_resolution(f):
-                quality_str = f.get('quality', '')
-                if isinstance(quality_str, str) and 'p' in quality_str:
-                    try:
-                        return int(quality_str.replace('p', ''))
-                    except:
-                        pass
-                return 0
-            
             # Check if we should merge (high quality video + audio)
-            video_formats = [f for f in formats if f.get('hasVideo')]
-            audio_formats = [f for f in formats if f.get('hasAudio') and not f.get('hasVideo')]
-            combined_formats = [f for f in formats if f.get('hasAudio') and f.get('hasVideo')]
+            # Partition in one pass; video formats are paired with their resolution,
+            # parsed once here rather than per sort
+            video_formats, audio_formats = [], []
+            for f in formats:
+                if f['hasVideo']:
+                    video_formats.append((_resolution(f['quality']), f))
+                elif f['hasAudio']:
+                    audio_formats.append(f)
             
             # Select video format based on quality
-            if quality == 'best':
-                video_formats.sort(key=get_resolution, reverse=True)
-                selected_video = video_formats[0] if video_formats else None
-            elif quality == 'worst':
-                video_formats.sort(key=get_resolution)
-                selected_video = video_formats[0] if video_formats else None
-            elif quality.endswith('p'):
-                try:
-                    target_res = int(quality.replace('p', ''))
-                    exact_match = [f for f in video_formats if get_resolution(f) == target_res]
-                    if exact_match:
-                        selected_video = exact_match[0]
-                    else:
-                        video_formats.sort(key=lambda f: abs(get_resolution(f) - target_res))
-                        selected_video = video_formats[0] if video_formats else None
-                        if selected_video:
-                            actual_res = get_resolution(selected_video)
-                            sys.stderr.write(f"Requested {quality} not available, using closest: {actual_res}p\n")
-                except ValueError:
-                    return {'error': f'Invalid quality format: {quality}. Use format like "720p" or "best"'}
-            else:
-                return {'error': f'Invalid quality: {quality}. Use "best", "worst", or a resolution like "720p"'}
+            try:
+                target_res, actual_res, selected_video = self._select_video(video_formats, quality)
+            except ValueError as e:
+                return {'error': str(e)}
+            if selected_video and target_res is not None and actual_res != target_res:
+                sys.stderr.write(f"Requested {quality} not available, using closest: {actual_res}p\n")
             
             if not selected_video:
                 return {'error': 'No suitable video format found'}
@@ -389,62 +1409,31 @@ class YouTubeDownloader:
                 sys.stderr.write(f"Mode: Separate video + audio (will merge with FFmpeg)\n\n")
                 
                 # Select best audio
-                audio_formats.sort(key=lambda x: x.get('bitrate', 0), reverse=True)
-                selected_audio = audio_formats[0]
+                selected_audio = max(audio_formats, key=lambda x: x.get('bitrate', 0))
                 
-                # Create temporary files
-                with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as video_temp:
-                    video_temp_path = video_temp.name
+                filename = f"{safe_title}_{info['id']}.mp4"
+                filepath = os.path.join(output_path, filename)
                 
-                with tempfile.NamedTemporaryFile(suffix='.m4a', delete=False) as audio_temp:
-                    audio_temp_path = audio_temp.name
+                if pipe_merge is None:
+                    pipe_merge = self.PIPE_MERGE
+                merge_streams = self._merge_via_pipes if pipe_merge and os.name == 'posix' else self._merge_via_files
+                with self._lock_target(filepath):
+                    ffmpeg_error = merge_streams(selected_video['url'], selected_audio['url'], filepath,
+                                                 selected_audio.get('mimeType') or '')
                 
-                try:
-                    # Download video stream
-                    self._download_stream(selected_video['url'], video_temp_path, "Downloading video stream...")
-                    
-                    # Download audio stream
-                    self._download_stream(selected_audio['url'], audio_temp_path, "Downloading audio stream...")
-                    
-                    # Merge with FFmpeg
-                    sys.stderr.write("\nMerging video and audio with FFmpeg...\n")
-                    
-                    filename = f"{safe_title}_{info['id']}.mp4"
-                    filepath = os.path.join(output_path, filename)
-                    
-                    # Use FFmpeg to merge
-                    ffmpeg_cmd = [
-                        'ffmpeg', '-y',
-                        '-i', video_temp_path,
-                        '-i', audio_temp_path,
-                        '-c:v', 'copy',
-                        '-c:a', 'aac',
-                        '-strict', 'experimental',
-                        filepath
-                    ]
-                    
-                    result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
-                    
-                    if result.returncode != 0:
-                        return {'error': f'FFmpeg merge failed: {result.stderr}'}
-                    
-                    sys.stderr.write("✓ Merge completed!\n")
-                    sys.stderr.write("✓ Download completed!\n")
-                    
-                    return {
-                        'success': True,
-                        'filename': filename,
-                        'filepath': filepath,
-                        'title': info['title'],
-                        'merged': True
-                    }
+                if ffmpeg_error is not None:
+                    return {'error': f'FFmpeg merge failed: {ffmpeg_error}'}
                 
-                finally:
-                    # Clean up temp files
-                    if os.path.exists(video_temp_path):
-                        os.unlink(video_temp_path)
-                    if os.path.exists(audio_temp_path):
-                        os.unlink(audio_temp_path)
+                sys.stderr.write("✓ Merge completed!\n")
+                sys.stderr.write("✓ Download completed!\n")
+                
+                return {
+                    'success': True,
+                    'filename': filename,
+                    'filepath': filepath,
+                    'title': info['title'],
+                    'merged': True
+                }
             
             else:
                 # Download single stream (has audio or merge disabled)
@@ -459,7 +1448,9 @@ class YouTubeDownloader:
                 
                 sys.stderr.write("\n")
                 
-                self._download_stream(selected_video['url'], filepath, "Downloading...")
+                with self._lock_target(filepath):
+                    self._download_stream(selected_video['url'], filepath, "Downloading...",
+                                          itag=selected_video['itag'])
                 
                 sys.stderr.write("✓ Download completed!\n")
                 
@@ -475,38 +1466,116 @@ class YouTubeDownloader:
             return {'error': str(e)}
 
 
+def _write_json(obj, pretty=False):
+    """Write a result to stdout as JSON - compact for the Node side, indented with --pretty"""
+    if orjson is not None:
+        sys.stdout.buffer.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0) + b'\n')
+    elif pretty:
+        print(json.dumps(obj, indent=2))
+    else:
+        print(json.dumps(obj, separators=(',', ':')))
+    sys.stdout.flush()
+
+
+def _parse_options(argv):
+    """Turn CLI arguments after <command> <url> into the options dict the handlers take"""
+    options = {
+        # A flag right after the URL (e.g. --pretty) means no output directory was given
+        'output': argv[3] if len(argv) > 3 and not argv[3].startswith('--') else './downloads',
+        'audioOnly': '--audio-only' in argv,
+        'merge': '--no-merge' not in argv,  # Merge by default
+    }
+    
+    # Only passed when given, so PIPE_MERGE stays the default
+    if '--pipe-merge' in argv:
+        options['pipeMerge'] = True
+    
+    # Extract quality parameter
+    if '--quality' in argv:
+        quality_idx = argv.index('--quality')
+        if quality_idx + 1 < len(argv):
+            options['quality'] = argv[quality_idx + 1]
+    
+    return options
+
+
+def _run_info(downloader, url, options):
+    return downloader.get_video_info(url)
+
+
+def _run_download(downloader, url, options):
+    return downloader.download_video(
+        url,
+        options.get('output') or './downloads',
+        quality=options.get('quality') or 'best',
+        audio_only=bool(options.get('audioOnly')),
+        merge=options.get('merge', True),
+        pipe_merge=options.get('pipeMerge'),
+    )
+
+
+COMMANDS = {
+    'info': _run_info,
+    'download': _run_download,
+}
+
+
+def _serve(downloader, max_workers=4):
+    """Answer JSON-line requests on stdin until EOF, reusing one downloader
+    
+    Each request looks like {"id": 1, "cmd": "info", "url": "..."} (download
+    requests may add output, quality, audioOnly, merge and pipeMerge). Each reply is one
+    line: {"id": 1, "result": {...}}. Up to max_workers requests run at once, so
+    replies can arrive in a different order than the requests; the id matches
+    them up. EOF waits for the requests still running.
+    """
+    write_lock = threading.Lock()
+    
+    def handle(line):
+        request_id = None
+        try:
+            request = _loads(line)
+            request_id = request.get('id')
+            handler = COMMANDS.get(request.get('cmd'))
+            if handler is None:
+                result = {'error': f"Unknown command: {request.get('cmd')}"}
+            else:
+                result = handler(downloader, request.get('url', ''), request)
+        except Exception as e:
+            result = {'error': f'Invalid request: {e}'}
+        
+        # Replies finishing together must not interleave on stdout
+        with write_lock:
+            _write_json({'id': request_id, 'result': result})
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for line in sys.stdin:
+            if line.strip():
+                executor.submit(handle, line)
+
+
 def main():
+    pretty = '--pretty' in sys.argv
+    
+    # Long-lived worker mode: keeps connections and the info cache warm between requests
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        _serve(YouTubeDownloader())
+        return
+    
     if len(sys.argv) < 3:
-        print(json.dumps({'error': 'Usage: python yt_downloader.py <command> <url> [options]'}))
+        _write_json({'error': 'Usage: python yt_downloader.py <command> <url> [options]'}, pretty)
         sys.exit(1)
     
     command = sys.argv[1]
     url = sys.argv[2]
     
-    downloader = YouTubeDownloader()
-    
-    if command == 'info':
-        info = downloader.get_video_info(url)
-        print(json.dumps(info, indent=2))
-    
-    elif command == 'download':
-        output_path = sys.argv[3] if len(sys.argv) > 3 else './downloads'
-        audio_only = '--audio-only' in sys.argv
-        merge = '--no-merge' not in sys.argv  # Merge by default
-        
-        # Extract quality parameter
-        quality = 'best'
-        if '--quality' in sys.argv:
-            quality_idx = sys.argv.index('--quality')
-            if quality_idx + 1 < len(sys.argv):
-                quality = sys.argv[quality_idx + 1]
-        
-        result = downloader.download_video(url, output_path, quality=quality, audio_only=audio_only, merge=merge)
-        print(json.dumps(result, indent=2))
-    
-    else:
-        print(json.dumps({'error': f'Unknown command: {command}'}))
+    handler = COMMANDS.get(command)
+    if handler is None:
+        _write_json({'error': f'Unknown command: {command}'}, pretty)
         sys.exit(1)
+    
+    result = handler(YouTubeDownloader(), url, _parse_options(sys.argv))
+    _write_json(result, pretty)
 
 
 if __name__ == '__main__':
@@ -53,13 +53,15 @@ program
     .option('-o, --output <path>', 'Output directory', join(__dirname, '../downloads'))
     .option('-a, --audio-only', 'Download audio only', false)
     .option('-q, --quality <resolution>', 'Video quality/resolution (e.g., 720p, 1080p, 480p, 360p, best, worst)', 'best')
+    .option('--pipe-merge', 'Stream video and audio straight into FFmpeg instead of temp files (no resume)')
     .action(async (url, options) => {
         try {
             console.log('Starting download...\n');
             
             const downloadOptions = {
                 audioOnly: options.audioOnly,
-                quality: options.quality
+                quality: options.quality,
+                pipeMerge: options.pipeMerge
             };
             
             const result = options.audioOnly 
@@ -10,6 +10,12 @@ class YtScrapper {
     constructor() {
         this.pythonScript = join(__dirname, '../python/yt_downloader.py');
         this.defaultOutputDir = join(__dirname, '../downloads');
+
+        // Persistent Python worker, and the requests waiting on it (or on a
+        // worker that close() detached but that is still finishing), by id
+        this._worker = null;
+        this._pending = new Map();
+        this._nextId = 1;
         
         // Ensure downloads directory exists
         if (!fs.existsSync(this.defaultOutputDir)) {
@@ -18,47 +24,146 @@ class YtScrapper {
     }
 
     /**
-     * Execute Python script and return parsed JSON result
+     * Start the long-lived Python worker (`yt_downloader.py serve`).
+     * One process serves every request so its HTTP connections and
+     * video info cache stay warm between calls. It runs several requests
+     * at once and may reply out of order; replies are matched by id.
      */
-    async _executePython(args) {
-        return new Promise((resolve, reject) => {
-            let stdout = '';
-            let stderr = '';
+    _startWorker() {
+        const worker = spawn('python3', [this.pythonScript, 'serve']);
+        let buffer = '';
+        let stderr = '';
+
+        // Replies are UTF-8 JSON lines; decode as a stream so multi-byte
+        // characters split across chunks stay intact
+        worker.stdout.setEncoding('utf8');
+        worker.stdout.on('data', (data) => {
+            buffer += data;
+
+            let newline;
+            while ((newline = buffer.indexOf('\n')) !== -1) {
+                const line = buffer.slice(0, newline);
+                buffer = buffer.slice(newline + 1);
+                if (line.trim()) {
+                    this._handleReply(worker, line);
+                }
+            }
+        });
 
-            const pythonProcess = spawn('python3', [this.pythonScript, ...args]);
+        worker.stderr.on('data', (data) => {
+            // Keep only the tail for error messages; progress output is noisy
+            stderr = (stderr + data.toString()).slice(-4096);
+        });
 
-            pythonProcess.stdout.on('data', (data) => {
-                stdout += data.toString();
-            });
+        worker.on('close', (code) => {
+            this._failWorker(worker, new Error(`Python script failed (exit code ${code}): ${stderr}`));
+        });
 
-            pythonProcess.stderr.on('data', (data) => {
-                stderr += data.toString();
-            });
+        worker.on('error', (err) => {
+            this._failWorker(worker, new Error(`Failed to start Python process: ${err.message}`));
+        });
 
-            pythonProcess.on('close', (code) => {
-                if (code !== 0 && !stdout) {
-                    reject(new Error(`Python script failed: ${stderr}`));
-                    return;
-                }
+        this._worker = worker;
+    }
 
-                try {
-                    const result = JSON.parse(stdout);
-                    if (result.error) {
-                        reject(new Error(result.error));
-                    } else {
-                        resolve(result);
-                    }
-                } catch (e) {
-                    reject(new Error(`Failed to parse Python output: ${stdout}\n${stderr}`));
-                }
-            });
+    /**
+     * Resolve or reject the pending request a worker reply belongs to
+     */
+    _handleReply(worker, line) {
+        let reply;
+        try {
+            reply = JSON.parse(line);
+        } catch (e) {
+            this._failWorker(worker, new Error(`Failed to parse Python output: ${line}`));
+            return;
+        }
 
-            pythonProcess.on('error', (err) => {
-                reject(new Error(`Failed to start Python process: ${err.message}`));
-            });
+        const pending = this._pending.get(reply.id);
+        if (!pending || pending.worker !== worker) {
+            return;
+        }
+
+        this._pending.delete(reply.id);
+        this._updateWorkerRef();
+
+        if (reply.result.error) {
+            pending.reject(new Error(reply.result.error));
+        } else {
+            pending.resolve(reply.result);
+        }
+    }
+
+    /**
+     * Reject everything still waiting on a worker that died, including one
+     * that close() already detached
+     */
+    _failWorker(worker, error) {
+        if (this._worker === worker) {
+            this._worker = null;
+        }
+        if (!worker.killed && worker.exitCode === null) {
+            worker.kill();
+        }
+
+        for (const [id, pending] of this._pending) {
+            if (pending.worker === worker) {
+                this._pending.delete(id);
+                pending.reject(error);
+            }
+        }
+    }
+
+    /**
+     * Only keep the event loop alive for the worker while requests are in flight
+     */
+    _updateWorkerRef() {
+        if (!this._worker) {
+            return;
+        }
+
+        let busy = false;
+        for (const pending of this._pending.values()) {
+            if (pending.worker === this._worker) {
+                busy = true;
+                break;
+            }
+        }
+
+        const method = busy ? 'ref' : 'unref';
+        this._worker[method]();
+        for (const stream of [this._worker.stdin, this._worker.stdout, this._worker.stderr]) {
+            stream[method]();
+        }
+    }
+
+    /**
+     * Send a command to the Python worker and return its parsed JSON result
+     */
+    async _executePython(command, params = {}) {
+        if (!this._worker) {
+            this._startWorker();
+        }
+
+        const id = this._nextId++;
+        return new Promise((resolve, reject) => {
+            this._pending.set(id, { resolve, reject, worker: this._worker });
+            this._updateWorkerRef();
+            this._worker.stdin.write(JSON.stringify({ id, cmd: command, ...params }) + '\n');
         });
     }
 
+    /**
+     * Stop the Python worker. It is restarted on the next request.
+     * Requests already sent still get their replies (or are rejected if
+     * the worker exits without answering).
+     */
+    close() {
+        if (this._worker) {
+            this._worker.stdin.end();
+            this._worker = null;
+        }
+    }
+
     /**
      * Get video information without downloading
      * @param {string} url - YouTube video URL
@@ -66,7 +171,7 @@ class YtScrapper {
      */
     async getInfo(url) {
         try {
-            const result = await this._executePython(['info', url]);
+            const result = await this._executePython('info', { url });
             return result;
         } catch (error) {
             throw new Error(`Failed to get video info: ${error.message}`);
@@ -80,6 +185,8 @@ class YtScrapper {
      * @param {Object} options - Download options
      * @param {string} options.quality - Video quality/resolution (e.g., '720p', '1080p', 'best', 'worst')
      * @param {boolean} options.audioOnly - Download audio only
+     * @param {boolean} options.pipeMerge - Stream separate video and audio straight into
+     *   FFmpeg instead of through temp files (POSIX only; interrupted merges can't resume)
      * @returns {Promise<Object>} Download result
      */
     async download(url, outputPath = null, options = {}) {
@@ -91,18 +198,13 @@ class YtScrapper {
                 fs.mkdirSync(output, { recursive: true });
             }
 
-            const args = ['download', url, output];
-            
-            if (options.audioOnly) {
-                args.push('--audio-only');
-            }
-            
-            if (options.quality) {
-                args.push('--quality');
-                args.push(options.quality);
-            }
-
-            const result = await this._executePython(args);
+            const result = await this._executePython('download', {
+                url,
+                output,
+                audioOnly: Boolean(options.audioOnly),
+                quality: options.quality,
+                pipeMerge: options.pipeMerge,
+            });
             return result;
         } catch (error) {
             throw new Error(`Failed to download video: ${error.message}`);